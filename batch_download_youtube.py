@@ -1,91 +1,183 @@
 import os
 import sys
-import time
 import argparse
+import asyncio
 import csv
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import re
+import threading
+import urllib.parse
+import urllib.request
+from urllib.error import HTTPError
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 
+# 可选使用orjson（C扩展）加速JSONL结果输出，未安装时退回标准库json
 try:
-    from yt_dlp import YoutubeDL
-    from yt_dlp.utils import DownloadError
+    import orjson
+    _json_dumps = orjson.dumps
 except ImportError:
-    print("正在安装yt-dlp库...")
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "yt-dlp"])
-    from yt_dlp import YoutubeDL
-    from yt_dlp.utils import DownloadError
+    import json
+
+    def _json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def _ensure_ytdlp():
+    """确保已安装yt-dlp，缺失时自动安装；yt-dlp在首次使用时才导入，加快启动速度"""
+    try:
+        import yt_dlp  # noqa: F401
+    except ImportError:
+        print("正在安装yt-dlp库...")
+        import subprocess
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "yt-dlp"])
+        # 安装后立即导入，之后各处的局部导入都直接命中已加载的模块
+        import importlib
+        importlib.invalidate_caches()
+        import yt_dlp  # noqa: F401
+
+# YouTube视频链接格式，用于在下载前过滤无效链接
+_YOUTUBE_URL_RE = re.compile(r'^https?://(www\.|m\.|music\.)?(youtube\.com|youtu\.be)/')
+
+# 预检视频是否存在的oEmbed接口，失效视频返回400/404
+_OEMBED_URL = "https://www.youtube.com/oembed?format=json&url="
+
+# 带视频ID的链接（watch?v=、youtu.be/、/shorts/），只有这类链接才做预检
+_VIDEO_ID_URL_RE = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/)[\w-]{11}')
+
+# 每个工作线程缓存一个YoutubeDL实例，复用其连接池和提取器
+_TLS = threading.local()
+_ydl_stack = ExitStack()
+_ydl_lock = threading.Lock()
+
+def _get_ydl(ydl_opts):
+    """获取当前线程的YoutubeDL实例，选项变化时才重新创建"""
+    ydl = getattr(_TLS, 'ydl', None)
+    # 同一批次共享同一个选项字典，按引用比较即可
+    if ydl is None or _TLS.ydl_opts is not ydl_opts:
+        from yt_dlp import YoutubeDL
+        # YoutubeDL会原地改写传入的选项（outtmpl、http_headers等），
+        # 每个线程复制一份，避免多个线程同时改写共享字典
+        ydl = YoutubeDL(dict(ydl_opts))
+        with _ydl_lock:
+            _ydl_stack.enter_context(ydl)
+        _TLS.ydl = ydl
+        _TLS.ydl_opts = ydl_opts
+    return ydl
+
+class ProgressMonitor:
+    """汇总所有下载任务的进度，由单独线程每秒输出一次总体速度"""
+    
+    def __init__(self, interval=1.0):
+        self._interval = interval
+        self._downloaded = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def hook(self, d):
+        """yt-dlp进度回调，只更新计数，不在下载线程中输出"""
+        if d.get('status') == 'downloading':
+            self._downloaded[d.get('filename')] = d.get('downloaded_bytes') or 0
+    
+    def _run(self):
+        last_total = 0
+        while not self._stop.wait(self._interval):
+            total = sum(list(self._downloaded.values()))
+            if total != last_total:
+                speed = (total - last_total) / self._interval / 1024 / 1024
+                print(f"下载进度: 已下载 {total / 1024 / 1024:.1f} MB，速度 {speed:.2f} MB/s")
+                last_total = total
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
 
-def download_video(url, output_path='.', proxy=None, format='best', max_retries=3, index=None, total=None):
+def build_ydl_opts(outtmpl, proxy=None, format='best', chunk_size=10, fragments=8, progress_hook=None, retries=10):
     """
-    使用yt-dlp下载YouTube视频
+    构建yt-dlp选项，整个批次只构建一次并由所有下载任务共享
     
     Args:
-        url (str): YouTube视频链接
-        output_path (str): 保存路径
+        outtmpl (str): 输出文件模板，需由调用方预先拼接好保存路径，
+            例如 os.path.join(output_path, '%(title)s.%(ext)s')
         proxy (str): 代理地址，例如 'http://127.0.0.1:2090'
         format (str): 视频格式，默认为最佳质量
-        max_retries (int): 最大重试次数
-        index (int): 当前下载的索引（用于批量下载）
-        total (int): 总下载数量（用于批量下载）
+        chunk_size (int): HTTP分块大小（MB），0表示不分块
+        fragments (int): HLS/DASH分片并发下载数
+        progress_hook (callable): 进度回调，设置后关闭yt-dlp自带的进度输出
+        retries (int): yt-dlp内部重试次数
         
     Returns:
-        tuple: (成功与否, 视频标题, 错误信息)
+        dict: yt-dlp选项
     """
-    # 确保输出目录存在
-    if not os.path.exists(output_path):
-        os.makedirs(output_path, exist_ok=True)
-        print(f"创建目录: {output_path}")
-    
-    # 设置yt-dlp选项
     ydl_opts = {
         'format': format,
-        'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
+        'outtmpl': outtmpl,
         'noplaylist': True,
         'no_warnings': False,
-        'ignoreerrors': True,
+        # 下载出错时抛出DownloadError，由外层重试逻辑处理
+        'ignoreerrors': False,
         'quiet': False,
         'verbose': False,  # 减少详细输出
-        'progress': True,
         'geo_bypass': True,  # 尝试绕过地理限制
         'geo_bypass_country': 'US',
         'socket_timeout': 30,  # 设置套接字超时
-        'retries': 10,  # 内部重试次数
+        'retries': retries,  # 内部重试次数
+        'concurrent_fragment_downloads': fragments,  # 并发下载分片
+        'buffersize': 1024 * 1024,  # 1MB读取缓冲区，减少recv调用
+        # 保持长连接，复用到CDN的TCP/TLS连接
+        'http_headers': {'Connection': 'keep-alive', 'Keep-Alive': 'timeout=90, max=1000'},
     }
     
+    # 大块HTTP请求，减少每MB的请求和系统调用次数
+    if chunk_size:
+        ydl_opts['http_chunk_size'] = chunk_size * 1024 * 1024
+    
     # 添加代理设置
     if proxy:
         ydl_opts['proxy'] = proxy
     
-    prefix = f"[{index}/{total}] " if index is not None and total is not None else ""
-    retries = 0
-    error_msg = ""
-    
-    while retries < max_retries:
-        try:
-            print(f"{prefix}尝试下载 {url}...")
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                if info:
-                    title = info.get('title', '未知标题')
-                    print(f"{prefix}下载完成: {title}")
-                    return True, title, ""
-                else:
-                    error_msg = "无法获取视频信息"
-                    print(f"{prefix}{error_msg}")
-        except DownloadError as e:
-            error_msg = f"下载错误: {e}"
-            print(f"{prefix}{error_msg}")
-        except Exception as e:
-            error_msg = f"发生错误: {e}"
-            print(f"{prefix}{error_msg}")
+    # 多个下载同时刷新进度会争抢终端输出，改为汇总后定时输出
+    if progress_hook:
+        ydl_opts['quiet'] = True
+        ydl_opts['noprogress'] = True
+        ydl_opts['progress_hooks'] = [progress_hook]
+    
+    return ydl_opts
+
+def download_video(url, ydl_opts, index=None, total=None):
+    """
+    使用yt-dlp下载YouTube视频（单次尝试，重试由_batch在事件循环中调度）
+    
+    Args:
+        url (str): YouTube视频链接
+        ydl_opts (dict): build_ydl_opts构建的yt-dlp选项（输出目录由batch_download预先创建）
+        index (int): 当前下载的索引（用于批量下载）
+        total (int): 总下载数量（用于批量下载）
         
-        retries += 1
-        if retries < max_retries:
-            wait_time = 2 ** retries
-            print(f"{prefix}等待 {wait_time} 秒后重试... ({retries}/{max_retries})")
-            time.sleep(wait_time)
+    Returns:
+        tuple: (成功与否, 视频标题, 错误信息)
+    """
+    from yt_dlp.utils import DownloadError
+    
+    prefix = f"[{index}/{total}] " if index is not None and total is not None else ""
+    
+    try:
+        print(f"{prefix}尝试下载 {url}...")
+        ydl = _get_ydl(ydl_opts)
+        info = ydl.extract_info(url, download=True)
+        if info:
+            title = info.get('title', '未知标题')
+            print(f"{prefix}下载完成: {title}")
+            return True, title, ""
+        error_msg = "无法获取视频信息"
+    except DownloadError as e:
+        error_msg = f"下载错误: {e}"
+    except Exception as e:
+        error_msg = f"发生错误: {e}"
     
-    print(f"{prefix}达到最大重试次数，下载失败")
+    print(f"{prefix}{error_msg}")
     return False, "", error_msg
 
 def read_urls_from_file(file_path):
@@ -97,17 +189,16 @@ def read_urls_from_file(file_path):
     ext = ext.lower()
     
     try:
-        if ext == '.csv':
-            # 从CSV文件读取
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                for row in reader:
+        # 使用1MB缓冲区打开文件，减少读取系统调用
+        with open(file_path, 'r', encoding='utf-8', newline='' if ext == '.csv' else None, buffering=1 << 20) as f:
+            if ext == '.csv':
+                # 从CSV文件读取
+                for row in csv.reader(f):
                     if row and row[0].strip():
                         urls.append(row[0].strip())
-        else:
-            # 从文本文件读取
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
+            else:
+                # 从文本文件读取：一次读入后按行拆分
+                for line in f.read().splitlines():
                     line = line.strip()
                     if line and not line.startswith('#'):
                         urls.append(line)
@@ -116,60 +207,196 @@ def read_urls_from_file(file_path):
     
     return urls
 
-def save_results(results, output_path):
-    """保存下载结果到CSV文件"""
-    result_file = os.path.join(output_path, "download_results.csv")
+def _csv_field(value):
+    """按CSV规则给字段加引号，内部引号加倍"""
+    return '"' + str(value).replace('"', '""') + '"'
+
+class ResultWriter:
+    """边下载边写入结果CSV，每条记录写入后立即flush，程序中途退出也不会丢失已完成的记录"""
+    
+    filename = "download_results.csv"
+    
+    def __init__(self, output_path):
+        self.result_file = os.path.join(output_path, self.filename)
+        # 所有字段统一加引号后直接写入字节，省去csv模块逐字段的转义判断
+        self._file = open(self.result_file, 'wb', buffering=1 << 20)
+        self._write_header()
+    
+    def _write_header(self):
+        self._write_row("URL", "状态", "标题", "错误信息")
+    
+    def _write_row(self, *fields):
+        self._file.write((",".join(map(_csv_field, fields)) + "\r\n").encode('utf-8'))
+    
+    def write(self, url, success, title, error):
+        """写入一条下载结果"""
+        self._write_row(url, "成功" if success else "失败", title, error)
+        # 每完成一个视频flush一次（不做fsync），相比下载耗时可以忽略
+        self._file.flush()
+    
+    def close(self):
+        self._file.close()
+        print(f"下载结果已保存到: {self.result_file}")
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class JsonlResultWriter(ResultWriter):
+    """以JSONL格式写入下载结果，每行一条JSON记录，便于程序处理"""
+    
+    filename = "download_results.jsonl"
+    
+    def _write_header(self):
+        pass
+    
+    def write(self, url, success, title, error):
+        """写入一条下载结果"""
+        self._file.write(_json_dumps({'url': url, 'ok': success, 'title': title, 'err': error}) + b"\n")
+        self._file.flush()
+
+def _check_url(opener, url):
+    """
+    通过oEmbed接口检查视频是否存在
+    
+    Returns:
+        str: 视频明确不存在时返回错误信息，否则返回空字符串
+    """
     try:
-        with open(result_file, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(["URL", "状态", "标题", "错误信息"])
-            for url, success, title, error in results:
-                writer.writerow([url, "成功" if success else "失败", title, error])
-        print(f"下载结果已保存到: {result_file}")
-    except Exception as e:
-        print(f"保存结果时出错: {e}")
+        with opener.open(_OEMBED_URL + urllib.parse.quote(url, safe=''), timeout=5):
+            return ""
+    except HTTPError as e:
+        # 只有明确不存在的视频才判定为失效，401（禁止嵌入等）仍交给yt-dlp处理
+        if e.code in (400, 404):
+            return f"预检失败: HTTP {e.code}"
+        return ""
+    except Exception:
+        # 网络问题无法判断，仍交给yt-dlp尝试下载
+        return ""
 
-def batch_download(urls, output_path, proxy, format, max_workers=3, max_retries=3):
-    """批量下载视频"""
-    total = len(urls)
-    results = []
+async def preflight_urls(urls, proxy=None, max_workers=32):
+    """
+    下载前并发预检带视频ID的URL，过滤掉已失效的视频；
+    频道、@用户名等其他链接oEmbed无法识别，不做预检直接交给yt-dlp
     
-    print(f"开始批量下载 {total} 个视频...")
+    Returns:
+        tuple: (可下载的URL列表, [(失效URL, 错误信息)])
+    """
+    loop = asyncio.get_running_loop()
+    handlers = [urllib.request.ProxyHandler({'http': proxy, 'https': proxy})] if proxy else []
+    opener = urllib.request.build_opener(*handlers)
     
-    # 使用线程池并发下载
+    checked = [url for url in urls if _VIDEO_ID_URL_RE.search(url)]
+    print(f"正在预检 {len(checked)} 个URL...")
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交所有下载任务
-        future_to_url = {
-            executor.submit(
-                download_video, 
-                url, 
-                output_path, 
-                proxy, 
-                format, 
-                max_retries,
-                i+1, 
-                total
-            ): url for i, url in enumerate(urls)
-        }
+        errors = await asyncio.gather(*(
+            loop.run_in_executor(executor, _check_url, opener, url) for url in checked
+        ))
+    
+    dead = [(url, error) for url, error in zip(checked, errors) if error]
+    dead_urls = {url for url, _ in dead}
+    live = [url for url in urls if url not in dead_urls]
+    return live, dead
+
+async def _batch(urls, ydl_opts, max_workers, max_retries, writer, proxy=None, preflight=True):
+    """在事件循环中调度下载任务，阻塞的yt-dlp调用交给线程池执行，返回成功数量"""
+    loop = asyncio.get_running_loop()
+    success_count = 0
+    
+    # 序号和总数始终按全部URL计算，与最终的成功统计一致
+    total = len(urls)
+    index_of = {url: i+1 for i, url in enumerate(urls)}
+    
+    # 先并发预检，失效链接直接记为失败，不再占用下载线程
+    if preflight:
+        urls, dead = await preflight_urls(urls, proxy)
+        for url, error in dead:
+            print(f"跳过失效链接: {url} ({error})")
+            writer.write(url, False, "", error)
+    
+    # 信号量限制同时下载的数量，其余任务在事件循环中排队等待
+    sem = asyncio.Semaphore(max_workers)
+    
+    # 结束后统一关闭各线程的YoutubeDL实例
+    with _ydl_stack, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        async def _download_once(url, index):
+            async with sem:
+                try:
+                    return await loop.run_in_executor(
+                        executor,
+                        download_video,
+                        url,
+                        ydl_opts,
+                        index,
+                        total
+                    )
+                except Exception as e:
+                    print(f"处理下载结果时出错: {e}")
+                    return False, "", str(e)
         
-        # 处理完成的任务
-        for future in as_completed(future_to_url):
-            url = future_to_url[future]
-            try:
-                success, title, error = future.result()
-                results.append((url, success, title, error))
-            except Exception as e:
-                print(f"处理下载结果时出错: {e}")
-                results.append((url, False, "", str(e)))
-    
-    # 统计结果
-    success_count = sum(1 for _, success, _, _ in results if success)
-    print(f"\n批量下载完成: 成功 {success_count}/{total}")
+        async def _download_with_retries(url, index):
+            prefix = f"[{index}/{total}] "
+            error = ""
+            for attempt in range(1, max_retries + 1):
+                # 只在实际下载时占用名额，退避等待期间让给其他任务
+                success, title, error = await _download_once(url, index)
+                if success:
+                    return True, title, ""
+                
+                if attempt < max_retries:
+                    wait_time = 2 ** attempt
+                    print(f"{prefix}等待 {wait_time} 秒后重试... ({attempt}/{max_retries})")
+                    await asyncio.sleep(wait_time)
+            
+            print(f"{prefix}达到最大重试次数，下载失败")
+            return False, "", error
+        
+        # 只下载一次时跳过整套重试逻辑
+        download = _download_once if max_retries == 1 else _download_with_retries
+        
+        async def _one(url, index):
+            nonlocal success_count
+            success, title, error = await download(url, index)
+            # 每个任务完成时直接处理自己的结果，都在事件循环线程中执行，写入和计数无需加锁
+            if success:
+                success_count += 1
+            writer.write(url, success, title, error)
+        
+        await asyncio.gather(*(_one(url, index_of[url]) for url in urls))
     
-    # 保存结果
-    save_results(results, output_path)
+    return success_count
+
+def batch_download(urls, output_path, proxy, format, max_workers=3, max_retries=3, chunk_size=10, fragments=8,
+                   result_format='csv', preflight=True):
+    """批量下载视频，返回成功下载的数量"""
+    total = len(urls)
     
-    return results
+    # 在启动线程池前一次性确保输出目录存在
+    try:
+        os.makedirs(output_path)
+        print(f"创建目录: {output_path}")
+    except FileExistsError:
+        pass
+    
+    print(f"开始批量下载 {total} 个视频...")
+    
+    # 在启动线程池前导入（必要时安装）yt-dlp，避免多个线程同时安装
+    _ensure_ytdlp()
+    
+    # 结果随下载完成逐条写入文件
+    writer_cls = JsonlResultWriter if result_format == 'jsonl' else ResultWriter
+    with ProgressMonitor() as monitor, writer_cls(output_path) as writer:
+        # 外层负责重试时关闭yt-dlp内部重试，避免两层重试叠加等待
+        internal_retries = 10 if max_retries == 1 else 0
+        outtmpl = os.path.join(output_path, '%(title)s.%(ext)s')
+        ydl_opts = build_ydl_opts(outtmpl, proxy, format, chunk_size, fragments, monitor.hook, internal_retries)
+        success_count = asyncio.run(_batch(urls, ydl_opts, max_workers, max_retries, writer, proxy, preflight))
+    
+    print(f"\n批量下载完成: 成功 {success_count}/{total}")
+    
+    return success_count
 
 def main():
     try:
@@ -183,6 +410,10 @@ def main():
         parser.add_argument('--no-proxy', action='store_true', help='不使用代理')
         parser.add_argument('--workers', type=int, default=3, help='同时下载的视频数量（默认为3）')
         parser.add_argument('--retries', type=int, default=3, help='每个视频的最大重试次数（默认为3）')
+        parser.add_argument('--chunk-size', type=int, default=10, help='HTTP分块大小，单位MB，0表示不分块（默认为10）')
+        parser.add_argument('--fragments', type=int, default=8, help='HLS/DASH分片并发下载数（默认为8）')
+        parser.add_argument('--result-format', choices=['csv', 'jsonl'], default='csv', help='下载结果文件格式（默认为csv）')
+        parser.add_argument('--no-preflight', action='store_true', help='下载前不预检URL是否有效')
         args = parser.parse_args()
         
         # 获取URL列表
@@ -206,6 +437,22 @@ def main():
             print("没有提供任何URL，退出程序")
             return
         
+        # 去重并过滤无效链接，避免浪费网络请求
+        seen = set()
+        valid_urls = []
+        for url in urls:
+            if url not in seen and _YOUTUBE_URL_RE.match(url):
+                seen.add(url)
+                valid_urls.append(url)
+        skipped = len(urls) - len(valid_urls)
+        if skipped:
+            print(f"跳过 {skipped} 个重复或无效的URL")
+        urls = valid_urls
+        
+        if not urls:
+            print("所有URL均为重复或无效链接，没有可下载的视频，退出程序")
+            return
+        
         # 获取保存路径
         download_path = args.path
         if download_path == '.' and not (args.file or args.urls):
@@ -229,6 +476,8 @@ def main():
         print(f"视频格式: {args.format}")
         print(f"并发下载数: {args.workers}")
         print(f"最大重试次数: {args.retries}")
+        print(f"HTTP分块大小: {args.chunk_size} MB")
+        print(f"分片并发数: {args.fragments}")
         
         # 确认是否继续
         if not (args.file or args.urls):
@@ -244,7 +493,11 @@ def main():
             proxy, 
             args.format, 
             args.workers, 
-            args.retries
+            args.retries,
+            args.chunk_size,
+            args.fragments,
+            args.result_format,
+            not args.no_preflight
         )
         
     except KeyboardInterrupt:
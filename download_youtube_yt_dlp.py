@@ -2,18 +2,56 @@ import os
 import sys
 import time
 import argparse
+import json
 
-try:
-    from yt_dlp import YoutubeDL
-    from yt_dlp.utils import DownloadError
-except ImportError:
-    print("正在安装yt-dlp库...")
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "yt-dlp"])
+def _ensure_ytdlp():
+    """确保已安装yt-dlp，缺失时自动安装；yt-dlp在首次使用时才导入，加快启动速度"""
+    try:
+        import yt_dlp  # noqa: F401
+    except ImportError:
+        print("正在安装yt-dlp库...")
+        import subprocess
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "yt-dlp"])
+        # 安装后立即导入，之后各处的局部导入都直接命中已加载的模块
+        import importlib
+        importlib.invalidate_caches()
+        import yt_dlp  # noqa: F401
+
+def _download_once(url, ydl_opts):
+    """下载一次，不做重试"""
     from yt_dlp import YoutubeDL
     from yt_dlp.utils import DownloadError
 
-def download_video(url, output_path='.', proxy=None, format='best', max_retries=3):
+    try:
+        print(f"尝试下载 {url}...")
+        with YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+            if info:
+                print(f"下载完成: {info.get('title', '未知标题')}")
+                return True
+            else:
+                print("无法获取视频信息")
+    except DownloadError as e:
+        print(f"下载错误: {e}")
+    except Exception as e:
+        print(f"发生错误: {e}")
+    return False
+
+def _download_with_retries(url, ydl_opts, max_retries):
+    """下载失败时按指数退避重试"""
+    for attempt in range(1, max_retries + 1):
+        if _download_once(url, ydl_opts):
+            return True
+
+        if attempt < max_retries:
+            wait_time = 2 ** attempt
+            print(f"等待 {wait_time} 秒后重试... ({attempt}/{max_retries})")
+            time.sleep(wait_time)
+
+    print("达到最大重试次数，下载失败")
+    return False
+
+def download_video(url, output_path='.', proxy=None, format='best', max_retries=3, chunk_size=10, fragments=8):
     """
     使用yt-dlp下载YouTube视频
 
@@ -23,14 +61,18 @@ def download_video(url, output_path='.', proxy=None, format='best', max_retries=
         proxy (str): 代理地址，例如 'http://127.0.0.1:2090'
         format (str): 视频格式，默认为最佳质量
         max_retries (int): 最大重试次数
+        chunk_size (int): HTTP分块大小（MB），0表示不分块
+        fragments (int): HLS/DASH分片并发下载数
 
     Returns:
         bool: 下载成功返回True，失败返回False
     """
     # 确保输出目录存在
-    if not os.path.exists(output_path):
-        os.makedirs(output_path, exist_ok=True)
+    try:
+        os.makedirs(output_path)
         print(f"创建目录: {output_path}")
+    except FileExistsError:
+        pass
 
     # 设置yt-dlp选项
     ydl_opts = {
@@ -38,71 +80,76 @@ def download_video(url, output_path='.', proxy=None, format='best', max_retries=
         'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
         'noplaylist': True,
         'no_warnings': False,
-        'ignoreerrors': True,
+        # 下载出错时抛出DownloadError，由外层重试逻辑处理
+        'ignoreerrors': False,
         'quiet': False,
         'verbose': False,  # 减少详细输出
         'progress': True,
         'geo_bypass': True,  # 尝试绕过地理限制
         'geo_bypass_country': 'US',
         'socket_timeout': 30,  # 设置套接字超时
-        'retries': 10,  # 内部重试次数
+        # 外层负责重试时关闭yt-dlp内部重试，避免两层重试叠加等待
+        'retries': 10 if max_retries == 1 else 0,
+        'concurrent_fragment_downloads': fragments,  # 并发下载分片
+        'buffersize': 1024 * 1024,  # 1MB读取缓冲区，减少recv调用
+        # 保持长连接，复用到CDN的TCP/TLS连接
+        'http_headers': {'Connection': 'keep-alive', 'Keep-Alive': 'timeout=90, max=1000'},
     }
 
+    # 大块HTTP请求，减少每MB的请求和系统调用次数
+    if chunk_size:
+        ydl_opts['http_chunk_size'] = chunk_size * 1024 * 1024
+
     # 添加代理设置
     if proxy:
         ydl_opts['proxy'] = proxy
 
-    retries = 0
-    while retries < max_retries:
-        try:
-            print(f"尝试下载 {url}...")
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                if info:
-                    print(f"下载完成: {info.get('title', '未知标题')}")
-                    return True
-                else:
-                    print("无法获取视频信息")
-        except DownloadError as e:
-            print(f"下载错误: {e}")
-        except Exception as e:
-            print(f"发生错误: {e}")
-
-        retries += 1
-        if retries < max_retries:
-            wait_time = 2 ** retries
-            print(f"等待 {wait_time} 秒后重试... ({retries}/{max_retries})")
-            time.sleep(wait_time)
+    _ensure_ytdlp()
 
-    print("达到最大重试次数，下载失败")
-    return False
+    # 只下载一次时跳过整套重试逻辑
+    if max_retries == 1:
+        return _download_once(url, ydl_opts)
+    return _download_with_retries(url, ydl_opts, max_retries)
 
-def list_formats(url, proxy=None):
-    """列出可用的视频格式"""
+def list_formats(url, proxy=None, as_json=False):
+    """列出可用的视频格式，as_json为True时以JSON输出"""
     ydl_opts = {
-        'listformats': True,
+        'listformats': not as_json,
         'quiet': True,
         'no_warnings': True,
     }
     if proxy:
         ydl_opts['proxy'] = proxy
 
+    _ensure_ytdlp()
+    from yt_dlp import YoutubeDL
+
+    # JSON模式下提示信息输出到标准错误，保证标准输出可直接解析
+    status_out = sys.stderr if as_json else sys.stdout
+
     try:
         with YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=False)
             if not info:
-                print("无法获取视频信息")
+                print("无法获取视频信息", file=status_out)
                 return []
 
             formats = info.get('formats', [])
             if not formats:
-                print("没有可用的格式")
+                print("没有可用的格式", file=status_out)
                 return []
 
-            print("\n可用的视频格式:")
-            print("-" * 80)
-            print(f"{'格式ID':<10}{'扩展名':<10}{'分辨率':<15}{'文件大小':<15}{'备注':<20}")
-            print("-" * 80)
+            if as_json:
+                sys.stdout.write(json.dumps(formats, ensure_ascii=False, default=str) + "\n")
+                return formats
+
+            # 先拼好整张表再一次性输出，避免逐行print
+            lines = [
+                "\n可用的视频格式:",
+                "-" * 80,
+                f"{'格式ID':<10}{'扩展名':<10}{'分辨率':<15}{'文件大小':<15}{'备注':<20}",
+                "-" * 80,
+            ]
 
             for f in formats:
                 format_id = f.get('format_id', 'N/A')
@@ -115,17 +162,20 @@ def list_formats(url, proxy=None):
                     filesize = "未知"
                 note = f.get('format_note', '')
 
-                print(f"{format_id:<10}{ext:<10}{resolution:<15}{filesize:<15}{note:<20}")
+                lines.append(f"{format_id:<10}{ext:<10}{resolution:<15}{filesize:<15}{note:<20}")
 
-            print("-" * 80)
-            print("特殊格式选项:")
-            print("best       - 最佳视频和音频质量")
-            print("bestvideo+bestaudio - 分别选择最佳视频和音频并合并")
-            print("-" * 80)
+            lines += [
+                "-" * 80,
+                "特殊格式选项:",
+                "best       - 最佳视频和音频质量",
+                "bestvideo+bestaudio - 分别选择最佳视频和音频并合并",
+                "-" * 80,
+            ]
+            sys.stdout.write("\n".join(lines) + "\n")
 
             return formats
     except Exception as e:
-        print(f"获取格式列表时出错: {e}")
+        print(f"获取格式列表时出错: {e}", file=status_out)
         return []
 
 def main():
@@ -138,6 +188,9 @@ def main():
         parser.add_argument('--format', default='best', help='视频格式（默认为best）')
         parser.add_argument('--no-proxy', action='store_true', help='不使用代理')
         parser.add_argument('--list-formats', action='store_true', help='列出可用的视频格式')
+        parser.add_argument('--json-formats', action='store_true', help='以JSON格式输出可用的视频格式')
+        parser.add_argument('--chunk-size', type=int, default=10, help='HTTP分块大小，单位MB，0表示不分块（默认为10）')
+        parser.add_argument('--fragments', type=int, default=8, help='HLS/DASH分片并发下载数（默认为8）')
         args = parser.parse_args()
 
         # 如果没有提供URL，则从输入获取
@@ -163,9 +216,16 @@ def main():
                 if custom_proxy:
                     proxy = custom_proxy
 
-        print(f"视频链接: {video_url}")
-        print(f"保存路径: {download_path}")
-        print(f"代理设置: {proxy}")
+        # JSON模式下标准输出只保留JSON，状态信息输出到标准错误
+        status_out = sys.stderr if args.json_formats else sys.stdout
+        print(f"视频链接: {video_url}", file=status_out)
+        print(f"保存路径: {download_path}", file=status_out)
+        print(f"代理设置: {proxy}", file=status_out)
+
+        # 只输出JSON格式列表，不下载视频
+        if args.json_formats:
+            list_formats(video_url, proxy, as_json=True)
+            return
 
         # 如果需要列出格式
         video_format = args.format
@@ -179,14 +239,16 @@ def main():
         print(f"视频格式: {video_format}")
 
         # 下载视频
-        success = download_video(video_url, download_path, proxy, video_format)
+        success = download_video(video_url, download_path, proxy, video_format,
+                                 chunk_size=args.chunk_size, fragments=args.fragments)
 
         # 如果使用代理失败，询问是否尝试直接下载
         if not success and proxy:
             try_direct = input("使用代理下载失败，是否尝试直接下载？(y/n): ").lower().strip() == 'y'
             if try_direct:
                 print("尝试直接下载...")
-                download_video(video_url, download_path, None, args.format)
+                download_video(video_url, download_path, None, args.format,
+                               chunk_size=args.chunk_size, fragments=args.fragments)
 
     except KeyboardInterrupt:
         print("\n用户取消操作")